@@ -1,28 +1,74 @@
 """Top of the Pops - AI-powered visual learning application."""
 
+import hashlib
 import os
-from urllib.parse import urlparse
-from flask import Flask, render_template, request, jsonify
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+import orjson
+from cachetools import TTLCache
+from flask import Flask, Response, render_template, request, jsonify
+from flask.json.provider import JSONProvider
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from dotenv import load_dotenv
 
-from services.sessions import get_session_data
-from services.gemini import generate_suggestions, generate_subcategories, generate_item_list, generate_item_details
+from services.sessions import get_session_data, new_details_cache, start_cleanup_thread
+from services.gemini import (
+    generate_suggestions, generate_subcategories, generate_item_list,
+    generate_item_details, generate_items_details
+)
 from services.wikipedia import fetch_wikipedia_images
-from services.content import get_language_instruction, render_markdown_in_result
+from services.content import get_language_instruction, render_markdown_in_result, SUPPORTED_LANGUAGES
+from services.cache import (
+    make_details_key, get_shared_details, set_shared_details, get_or_submit_image_fetch,
+    claim_details_lookup, release_details_lookup,
+    make_list_key, get_shared_list, set_shared_list
+)
 
 load_dotenv()
 
+
+class ORJSONProvider(JSONProvider):
+    """JSON provider backed by orjson for faster (de)serialization."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Pass orjson's bytes straight through instead of decoding to str and re-encoding
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype='application/json')
+
+
 app = Flask(__name__)
-app.secret_key = os.urandom(24)
+app.json = ORJSONProvider(app)
+# A stable key keeps session cookies valid across restarts; random is fine for local dev.
+# SECRET_KEY is still read for existing deployments.
+app.secret_key = os.getenv('FLASK_SECRET_KEY') or os.getenv('SECRET_KEY') or os.urandom(24)
+
+# Worker pool for overlapping independent upstream calls
+executor = ThreadPoolExecutor(max_workers=16)
+
+# Expire idle sessions in the background instead of on a request's time
+start_cleanup_thread()
+
+# Small separate pool for warming images so prefetching can't starve live requests
+# or hammer Wikipedia
+PREFETCH_COUNT = 10
+prefetch_executor = ThreadPoolExecutor(max_workers=4)
 
 # Rate limiting configuration
 limiter = Limiter(
     get_remote_address,
     app=app,
     default_limits=["100 per hour"],
-    storage_uri="memory://",
+    # Point at redis:// in multi-worker deployments so limits are shared
+    storage_uri=os.getenv('RATELIMIT_STORAGE_URI', 'memory://'),
+    # fixed-window is cheapest; sliding-window-counter smooths bursts at window edges
+    strategy=os.getenv('RATELIMIT_STRATEGY', 'fixed-window'),
 )
 
 
@@ -42,9 +88,9 @@ def check_origin():
     if request.path.startswith('/api/'):
         origin = request.headers.get('Origin')
         if origin:
-            origin_host = urlparse(origin).netloc
-            request_host = request.host
-            if origin_host != request_host:
+            # Origin is always scheme://host[:port], so plain splitting beats urlparse
+            origin_host = origin.partition('://')[2].partition('/')[0]
+            if origin_host != request.host:
                 return jsonify({
                     'error': 'forbidden',
                     'message': 'Cross-origin requests are not allowed'
@@ -59,41 +105,142 @@ def set_security_headers(response):
     return response
 
 
+# Item count bounds for generated lists
+MIN_COUNT = 1
+MAX_COUNT = 100
+
+
+def parse_count(value):
+    """Clamp a requested item count to [MIN_COUNT, MAX_COUNT], or None if not an integer."""
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        return None
+    if count < MIN_COUNT:
+        return MIN_COUNT
+    if count > MAX_COUNT:
+        return MAX_COUNT
+    return count
+
+
+def parse_language(value):
+    """Return value if it is a supported language code, otherwise 'en'."""
+    if isinstance(value, str) and value in SUPPORTED_LANGUAGES:
+        return value
+    return 'en'
+
+
+def make_etag(body):
+    """Return a short content hash of a response body for use as an ETag."""
+    return hashlib.blake2b(body, digest_size=8).hexdigest()
+
+
+def cached_json_bytes(body, etag, max_age):
+    """Return pre-serialized JSON with ETag/Cache-Control, or 304 if the client has it."""
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'private, max-age={max_age}'
+    return response.make_conditional(request)
+
+
+def get_json_body():
+    """Parse the request body as a JSON object, or return None if it isn't one.
+
+    The Content-Type must be JSON: text/plain and form posts can be sent
+    cross-site without a CORS preflight, so they're rejected like bad JSON.
+    """
+    if not request.is_json:
+        return None
+    try:
+        data = orjson.loads(request.get_data(cache=False))
+    except orjson.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+# The page has no per-request template variables, so render it once at startup
+with app.test_request_context('/'):
+    INDEX_HTML = render_template('index.html').encode('utf-8')
+
+
 @app.route('/')
 def index():
     """Serve the main page."""
-    return render_template('index.html')
+    # Re-render in debug mode so template edits show up without a restart
+    if app.debug:
+        return render_template('index.html')
+    return Response(INDEX_HTML, mimetype='text/html')
+
+
+# Cache for suggestions, refreshed hourly. Holds the serialized response body and its ETag.
+SUGGESTIONS_TTL_SECONDS = 3600
+suggestions_cache = TTLCache(maxsize=1, ttl=SUGGESTIONS_TTL_SECONDS)
+suggestions_lock = Lock()
+# Future for the refresh in progress, if any. Concurrent misses share its
+# outcome, success or error, so one Gemini call serves them all.
+suggestions_refresh = None
+
+# Fallback suggestions if AI fails
+FALLBACK_SUGGESTIONS = (
+    "movie stars", "rock bands", "car brands", "world leaders",
+    "tech billionaires", "80s pop stars", "ancient philosophers",
+    "Renaissance painters", "Nobel Prize winners", "Olympic athletes",
+    "British monarchs", "90s sitcoms", "video game franchises",
+    "fashion designers", "classical composers", "TikTok stars 2020",
+    "Marvel superheroes", "world cuisines", "space missions", "dog breeds"
+)
+
 
+def load_suggestions():
+    """Return the cached (body, etag) for suggestions, generating them if the cache is empty or expired.
+
+    Requests that miss while a refresh is running wait for it and get its
+    result or its error, so during an outage they fall back together instead
+    of retrying Gemini one after another. Call suggestions_cache.clear() to
+    force a refresh.
+    """
+    global suggestions_refresh
+    with suggestions_lock:
+        cached = suggestions_cache.get('suggestions')
+        if cached:
+            return cached
+        pending = suggestions_refresh
+        if pending is None:
+            pending = suggestions_refresh = Future()
+            is_owner = True
+        else:
+            is_owner = False
+
+    if not is_owner:
+        return pending.result()
 
-# Cache for suggestions
-suggestions_cache = []
+    try:
+        suggestions = generate_suggestions().get('suggestions', [])[:20]
+        body = orjson.dumps({'suggestions': suggestions})
+        cached = (body, make_etag(body))
+    except Exception as e:
+        with suggestions_lock:
+            suggestions_refresh = None
+        pending.set_exception(e)
+        raise
+
+    with suggestions_lock:
+        suggestions_cache['suggestions'] = cached
+        suggestions_refresh = None
+    pending.set_result(cached)
+    return cached
 
 
 @app.route('/api/suggestions')
 @limiter.limit("10 per minute")
 def get_suggestions():
     """Get AI-generated quiz category suggestions."""
-    global suggestions_cache
-
-    if suggestions_cache:
-        return jsonify({'suggestions': suggestions_cache})
-
     try:
-        result = generate_suggestions()
-        suggestions_cache = result.get('suggestions', [])[:20]
-        return jsonify({'suggestions': suggestions_cache})
-
+        body, etag = load_suggestions()
     except Exception as e:
-        # Fallback suggestions if AI fails
-        fallback = [
-            "movie stars", "rock bands", "car brands", "world leaders",
-            "tech billionaires", "80s pop stars", "ancient philosophers",
-            "Renaissance painters", "Nobel Prize winners", "Olympic athletes",
-            "British monarchs", "90s sitcoms", "video game franchises",
-            "fashion designers", "classical composers", "TikTok stars 2020",
-            "Marvel superheroes", "world cuisines", "space missions", "dog breeds"
-        ]
-        return jsonify({'suggestions': fallback})
+        return jsonify({'suggestions': FALLBACK_SUGGESTIONS})
+
+    return cached_json_bytes(body, etag, SUGGESTIONS_TTL_SECONDS)
 
 
 # 16 broad quiz categories for category exploration
@@ -114,7 +261,9 @@ def get_broad_categories():
 @limiter.limit("20 per minute")
 def get_subcategories():
     """Get AI-generated subcategory suggestions for a broad category."""
-    data = request.json
+    data = get_json_body()
+    if data is None:
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
     category = data.get('category', '')[:100]
 
     if not category:
@@ -151,21 +300,34 @@ def get_subcategories():
 @limiter.limit("20 per hour")
 def generate_list():
     """Generate a ranked list of items for the given category."""
-    data = request.json
+    data = get_json_body()
+    if data is None:
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
     category = data.get('category', '')[:200]
-    count = min(max(int(data.get('count', 10)), 1), 100)
-    language = data.get('language', 'en')[:5]
+    count = parse_count(data.get('count', 10))
+    language = parse_language(data.get('language', 'en'))
 
     if not category:
         return jsonify({'error': 'Category is required'}), 400
 
+    if count is None:
+        return jsonify({'error': 'Count must be an integer'}), 400
+
     if len(category.strip()) < 2:
         return jsonify({'error': 'Category must be at least 2 characters'}), 400
 
     language_instruction = get_language_instruction(language)
 
     try:
-        result = generate_item_list(category, count, language_instruction)
+        # Identical requests from any session reuse the generated list
+        list_key = make_list_key(category, count, language)
+        result = get_shared_list(list_key)
+        if result is None:
+            result = generate_item_list(category, count, language_instruction)
+            # Only share real lists; an empty or malformed reply would stick for every session
+            items = result.get('items')
+            if isinstance(items, list) and items:
+                set_shared_list(list_key, result)
 
         # Store in session
         session_data = get_session_data()
@@ -173,7 +335,16 @@ def generate_list():
         session_data['language'] = language
         session_data['items'] = result.get('items', [])
         session_data['properties'] = result.get('properties', [])
-        session_data['details_cache'] = {}
+        with session_data['details_lock']:
+            session_data['details_cache'] = new_details_cache()
+
+        # Warm Wikipedia images for the first items before the user clicks them.
+        # Translated names can match the wrong English Wikipedia page, so other
+        # languages wait for the English names in the details response.
+        if language == 'en':
+            for item in session_data['items'][:PREFETCH_COUNT]:
+                if isinstance(item, str):
+                    get_or_submit_image_fetch(prefetch_executor, fetch_wikipedia_images, item[:200], category)
 
         return jsonify(result)
 
@@ -181,54 +352,121 @@ def generate_list():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/get-item-details', methods=['POST'])
-@limiter.limit("30 per minute")
-def get_item_details():
-    """Get details for a specific item including images."""
-    data = request.json
-    item = data.get('item', '')[:200]
-    category = data.get('category', '')[:200]
-    properties = data.get('properties', [])[:10]
-    language = data.get('language', 'en')[:5]
-
-    if not item:
-        return jsonify({'error': 'Item is required'}), 400
+def parse_details_options(data, session_data):
+    """Return the (category, properties, language) a details request asked for.
 
+    Anything the request leaves out falls back to the session's current list.
+    """
+    category = data.get('category', '')[:200]
     # Validate properties
-    properties = [str(p)[:50] for p in properties if isinstance(p, str)]
-
-    session_data = get_session_data()
-
-    # Check cache
-    if item in session_data['details_cache']:
-        return jsonify(session_data['details_cache'][item])
+    properties = [str(p)[:50] for p in data.get('properties', [])[:10] if isinstance(p, str)]
+    language = parse_language(data.get('language', 'en'))
 
     # Use session data if not provided
     if not category:
-        category = session_data.get('category', 'general')
+        category = session_data.get('category') or 'general'
     if not properties:
         properties = session_data.get('properties', [])
     if language == 'en':
         language = session_data.get('language', 'en')
+    return category, properties, language
 
+
+def build_item_details(item, category, properties, language, cache_key):
+    """Generate item details with images and store them in the shared cache."""
     language_instruction = get_language_instruction(language)
 
-    try:
-        result = generate_item_details(item, category, properties, language, language_instruction)
+    # English images don't depend on the Gemini response, so fetch them in parallel
+    # (or pick up the fetch prefetched by generate_list)
+    image_future = None
+    if language == 'en':
+        image_future = get_or_submit_image_fetch(executor, fetch_wikipedia_images, item, category)
+
+    result = generate_item_details(item, category, properties, language, language_instruction)
+
+    if image_future is None:
+        image_future = submit_english_image_fetch(result, item, category)
+
+    return finish_item_details(result, item, category, image_future, cache_key)
+
+
+def submit_english_image_fetch(result, item, category):
+    """Start the image fetch for a non-English result using the English names Gemini returned."""
+    return get_or_submit_image_fetch(
+        executor, fetch_wikipedia_images,
+        result.get('english_name') or item, result.get('english_category') or category
+    )
+
+
+def finish_item_details(result, item, category, image_future, cache_key):
+    """Render a Gemini details result, attach its images and store it in the shared cache."""
+    # Render markdown in description and properties
+    render_markdown_in_result(result)
+
+    # Only needed to pick the image search; not part of the response
+    result.pop('english_name', None)
+    result.pop('english_category', None)
+
+    image_result = image_future.result()
+
+    result['images'] = image_result['images']
+    result['image_status'] = image_result['status']
+    result['image_source'] = image_result.get('source_page')
+
+    # Don't share results whose image fetch failed transiently
+    if result['image_status'] != 'error':
+        set_shared_details(cache_key, result)
+
+    return result
+
+
+@app.route('/api/get-item-details', methods=['POST'])
+@limiter.limit("30 per minute")
+def get_item_details():
+    """Get details for a specific item including images."""
+    data = get_json_body()
+    if data is None:
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    item = data.get('item', '')[:200]
+
+    if not item:
+        return jsonify({'error': 'Item is required'}), 400
+
+    session_data = get_session_data()
+    details_lock = session_data['details_lock']
+
+    # Check cache (get() also refreshes LRU recency)
+    with details_lock:
+        cached = session_data['details_cache'].get(item)
+    if cached is not None:
+        return jsonify(cached)
 
-        # Render markdown in description and properties
-        render_markdown_in_result(result)
+    category, properties, language = parse_details_options(data, session_data)
 
-        # Fetch Wikipedia images using English names for better results
-        search_name = result.pop('english_name', None) or item
-        search_category = result.pop('english_category', None) or category
-        image_result = fetch_wikipedia_images(search_name, category=search_category)
-        result['images'] = image_result['images']
-        result['image_status'] = image_result['status']
-        result['image_source'] = image_result.get('source_page')
+    # Check cross-session cache
+    cache_key = make_details_key(item, category, properties, language)
+    shared = get_shared_details(cache_key)
+    if shared is not None:
+        with details_lock:
+            session_data['details_cache'][item] = shared
+        return jsonify(shared)
 
-        # Cache the result
-        session_data['details_cache'][item] = result
+    # Concurrent requests for the same details, from any session, share one lookup
+    pending, is_owner = claim_details_lookup(cache_key)
+
+    try:
+        if is_owner:
+            try:
+                result = build_item_details(item, category, properties, language, cache_key)
+            except Exception as e:
+                pending.set_exception(e)
+                raise
+            pending.set_result(result)
+        else:
+            result = pending.result()
+
+        with details_lock:
+            session_data['details_cache'][item] = result
 
         return jsonify(result)
 
@@ -236,6 +474,80 @@ def get_item_details():
         print(f"Error getting details for '{item}': {e}")
         return jsonify({'error': str(e)}), 500
 
+    finally:
+        if is_owner:
+            release_details_lookup(cache_key)
+
+
+# Most items a single batch details request may ask for
+MAX_BATCH_ITEMS = 10
+
+
+@app.route('/api/get-item-details-batch', methods=['POST'])
+@limiter.limit("10 per minute")
+def get_item_details_batch():
+    """Get details for several items with one Gemini call, including images."""
+    data = get_json_body()
+    if data is None:
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    items = data.get('items', [])
+
+    if not isinstance(items, list):
+        return jsonify({'error': 'Items must be a list'}), 400
+
+    # Validate items, dropping duplicates but keeping order
+    items = list(dict.fromkeys(i[:200] for i in items if isinstance(i, str) and i))[:MAX_BATCH_ITEMS]
+    if not items:
+        return jsonify({'error': 'Items are required'}), 400
+
+    session_data = get_session_data()
+    details_lock = session_data['details_lock']
+    category, properties, language = parse_details_options(data, session_data)
+
+    # Serve what we can from the session and cross-session caches
+    with details_lock:
+        results = {item: session_data['details_cache'].get(item) for item in items}
+    cache_keys = {}
+    for item in items:
+        if results[item] is None:
+            cache_keys[item] = make_details_key(item, category, properties, language)
+            results[item] = get_shared_details(cache_keys[item])
+    missing = [item for item in items if results[item] is None]
+
+    if missing:
+        try:
+            image_futures = {}
+            if language == 'en':
+                image_futures = {
+                    item: get_or_submit_image_fetch(executor, fetch_wikipedia_images, item, category)
+                    for item in missing
+                }
+            language_instruction = get_language_instruction(language)
+            generated = generate_items_details(missing, category, properties, language, language_instruction)
+
+            # Results are keyed by requested item; items Gemini dropped are left out
+            if language != 'en':
+                image_futures = {
+                    item: submit_english_image_fetch(result, item, category)
+                    for item, result in generated.items()
+                }
+            for item, result in generated.items():
+                results[item] = finish_item_details(
+                    result, item, category, image_futures[item], cache_keys[item]
+                )
+
+        except (ValueError, Exception) as e:
+            print(f"Error getting batch details for {missing}: {e}")
+            return jsonify({'error': str(e)}), 500
+
+    # Keyed by the requested item name so clients can match results to their list
+    found = {item: result for item, result in results.items() if result is not None}
+    with details_lock:
+        for item, result in found.items():
+            session_data['details_cache'][item] = result
+
+    return jsonify({'items': found})
+
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
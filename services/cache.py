@@ -0,0 +1,161 @@
+"""Process-wide caches shared across sessions."""
+
+import hashlib
+import os
+from concurrent.futures import Future
+from threading import Lock
+from cachetools import TTLCache
+from diskcache import Cache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class SharedCache:
+    """TTL cache shared across sessions: on disk if a directory is given, otherwise in memory."""
+
+    def __init__(self, directory, maxsize, ttl, disk_limit):
+        self.directory = directory
+        self.ttl = ttl
+        if directory:
+            # diskcache is thread- and process-safe and handles expiry itself
+            self.store = Cache(directory, size_limit=disk_limit)
+        else:
+            self.store = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.lock = Lock()
+
+    def get(self, key):
+        """Return the cached value for key, or None."""
+        if self.directory:
+            return self.store.get(key)
+        with self.lock:
+            return self.store.get(key)
+
+    def set(self, key, value):
+        """Store value under key for ttl seconds."""
+        if self.directory:
+            self.store.set(key, value, expire=self.ttl)
+            return
+        with self.lock:
+            self.store[key] = value
+
+    def clear(self):
+        """Drop all entries."""
+        with self.lock:
+            self.store.clear()
+
+
+# Shared item details cache configuration
+SHARED_DETAILS_CACHE_SIZE = 2048
+SHARED_DETAILS_TTL_SECONDS = 86400  # 1 day
+SHARED_DETAILS_DISK_LIMIT = 500 * 1024 * 1024  # 500 MB
+
+# Set DETAILS_CACHE_DIR to persist details across restarts and worker recycles
+DETAILS_CACHE_DIR = os.getenv('DETAILS_CACHE_DIR')
+
+shared_details_cache = SharedCache(
+    DETAILS_CACHE_DIR, SHARED_DETAILS_CACHE_SIZE, SHARED_DETAILS_TTL_SECONDS, SHARED_DETAILS_DISK_LIMIT
+)
+
+# Shared generated lists cache configuration
+SHARED_LISTS_CACHE_SIZE = 512
+SHARED_LISTS_TTL_SECONDS = 7 * 86400  # 1 week
+SHARED_LISTS_DISK_LIMIT = 50 * 1024 * 1024  # 50 MB
+
+# Set LIST_CACHE_DIR to persist generated lists across restarts and worker recycles
+LIST_CACHE_DIR = os.getenv('LIST_CACHE_DIR')
+
+shared_lists_cache = SharedCache(
+    LIST_CACHE_DIR, SHARED_LISTS_CACHE_SIZE, SHARED_LISTS_TTL_SECONDS, SHARED_LISTS_DISK_LIMIT
+)
+
+
+# In-flight and recently finished Wikipedia image fetches as (future, pool), keyed by normalized (item, category)
+IMAGE_FUTURES_CACHE_SIZE = 1024
+IMAGE_FUTURES_TTL_SECONDS = 3600  # 1 hour
+
+image_futures = TTLCache(maxsize=IMAGE_FUTURES_CACHE_SIZE, ttl=IMAGE_FUTURES_TTL_SECONDS)
+image_futures_lock = Lock()
+
+
+# Item details lookups in progress, keyed by make_details_key()
+details_inflight = {}
+details_inflight_lock = Lock()
+
+
+def make_details_key(item, category, properties, language):
+    """Build a cache key for generated item details."""
+    raw = '\x1f'.join([item, category, ','.join(properties), language])
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def get_shared_details(key):
+    """Return cached item details for key, or None."""
+    return shared_details_cache.get(key)
+
+
+def set_shared_details(key, result):
+    """Store item details for reuse across sessions."""
+    shared_details_cache.set(key, result)
+
+
+def make_list_key(category, count, language):
+    """Build a cache key for a generated item list; category case and spacing don't matter."""
+    raw = '\x1f'.join([category.strip().lower(), str(count), language])
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def get_shared_list(key):
+    """Return a cached generated list for key, or None."""
+    return shared_lists_cache.get(key)
+
+
+def set_shared_list(key, result):
+    """Store a generated list for reuse across sessions."""
+    shared_lists_cache.set(key, result)
+
+
+def get_or_submit_image_fetch(pool, fetch, item, category):
+    """Return a future for fetch(item, category=category), reusing one already submitted.
+
+    A fetch still queued on another pool (e.g. behind other prefetches) is
+    cancelled and resubmitted on pool, so a live request never waits for that
+    queue to drain. Futures that finished with an 'error' status are replaced
+    so transient failures get retried. Like the image cache, the key ignores
+    case and surrounding spaces, so concurrent clicks on "Paris" and "paris"
+    share a fetch.
+    """
+    key = (item.strip().lower(), (category or '').strip().lower())
+    with image_futures_lock:
+        entry = image_futures.get(key)
+        if entry is not None:
+            future, owner_pool = entry
+            if future.done() and not future.cancelled():
+                if future.result()['status'] != 'error':
+                    return future
+            elif owner_pool is pool or not future.cancel():
+                # Running, or queued on this same pool: wait for it
+                return future
+        future = pool.submit(fetch, item, category=category)
+        image_futures[key] = (future, pool)
+        return future
+
+
+def claim_details_lookup(key):
+    """Return (future, is_owner) for the item details lookup under key.
+
+    The first caller owns the lookup: it must resolve the future and then call
+    release_details_lookup(key). Concurrent callers get the same future to wait on.
+    """
+    with details_inflight_lock:
+        future = details_inflight.get(key)
+        if future is not None:
+            return future, False
+        future = details_inflight[key] = Future()
+        return future, True
+
+
+def release_details_lookup(key):
+    """Forget a finished lookup so later misses start a fresh one."""
+    with details_inflight_lock:
+        details_inflight.pop(key, None)
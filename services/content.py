@@ -1,12 +1,81 @@
 """Content processing: markdown rendering and language support."""
 
 import re
-import markdown
-import bleach
+from functools import lru_cache
+from markdown_it import MarkdownIt
 
-# Allowed HTML tags and attributes for sanitized markdown output
+# Allowed HTML tags for sanitized markdown output; no attributes are allowed
 ALLOWED_TAGS = ['p', 'strong', 'em', 'b', 'i', 'ul', 'ol', 'li', 'br']
-ALLOWED_ATTRIBUTES = {}
+ALLOWED_TAG_SET = frozenset(ALLOWED_TAGS)
+VOID_TAGS = frozenset({'br'})
+
+# Any start or end tag, and HTML comments (including an unterminated trailing one)
+TAG_RE = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9]*)\b[^>]*>')
+COMMENT_RE = re.compile(r'<!--.*?(?:-->|$)', re.DOTALL)
+
+# Shared parser; MarkdownIt.render() keeps no state between calls
+md = MarkdownIt('commonmark')
+
+# CommonMark starts a list at "1975." (empty item) or "1066)"; python-markdown,
+# which AI values were written against, needs "1. " with a space. The sanitizer
+# drops <ol start>, so those values lost their number; escape the delimiter instead.
+LIST_MARKER_RE = re.compile(r'^( {0,3}\d{1,9})(\)|\.(?=[ \t]*$))', re.MULTILINE)
+
+# Text made only of letters, digits, spaces and these punctuation marks can't contain
+# markdown syntax, HTML or characters that need escaping, so it renders to itself.
+# The lookahead rules out the few block starts these characters can still form:
+# ordered list items ("1. Queen"), bullets ("- x") and thematic breaks ("---").
+# A bare "1975." or "1066) Hastings" is plain text; see LIST_MARKER_RE.
+PLAIN_TEXT_RE = re.compile(
+    r"(?!\d{1,9}\.\s|[-+](?:\s|$)|[-\s]*$)"
+    r"(?:[^\W_]|[ ,;:'/%?@$.()\-!+=])+"
+)
+WRAPPING_P_RE = re.compile(r'^<p>(.*)</p>$', re.DOTALL)
+
+
+def escape_brackets(text):
+    """Escape angle brackets left in text between tags."""
+    return text.replace('<', '&lt;').replace('>', '&gt;')
+
+
+def escape_list_markers(text):
+    """Escape ordered list markers that python-markdown wouldn't treat as lists."""
+    return LIST_MARKER_RE.sub(r'\1\\\2', text)
+
+
+def sanitize_html(html):
+    """Keep only allowed tags, stripped of attributes, and escape every other bracket.
+
+    Disallowed tags are dropped but their text is kept. Unclosed allowed tags are
+    closed and stray end tags dropped, so a value can't leak formatting into the page.
+    """
+    html = COMMENT_RE.sub('', html)
+    out = []
+    open_tags = []
+    pos = 0
+    for match in TAG_RE.finditer(html):
+        out.append(escape_brackets(html[pos:match.start()]))
+        pos = match.end()
+        is_end, name = match.group(1), match.group(2).lower()
+        if name not in ALLOWED_TAG_SET:
+            continue
+        if name in VOID_TAGS:
+            if not is_end:
+                out.append(f'<{name}>')
+        elif not is_end:
+            open_tags.append(name)
+            out.append(f'<{name}>')
+        elif name in open_tags:
+            # Close anything still open inside this element first
+            while True:
+                tag = open_tags.pop()
+                out.append(f'</{tag}>')
+                if tag == name:
+                    break
+    out.append(escape_brackets(html[pos:]))
+    out.extend(f'</{tag}>' for tag in reversed(open_tags))
+    return ''.join(out)
+
 
 # Supported languages for AI responses
 SUPPORTED_LANGUAGES = {
@@ -33,6 +102,7 @@ SUPPORTED_LANGUAGES = {
 }
 
 
+@lru_cache(maxsize=64)
 def get_language_instruction(language_code):
     """Get prompt instruction for responding in a specific language."""
     if language_code == 'en' or language_code not in SUPPORTED_LANGUAGES:
@@ -50,13 +120,23 @@ def render_markdown(text, inline=False):
     """
     if not text:
         return ''
+    text = str(text)
+    # Most property values ("1975", "Japan") are plain text; skip the parser and sanitizer
+    if PLAIN_TEXT_RE.fullmatch(text) and text == text.strip():
+        return text if inline else f'<p>{text}</p>'
+    return render_markdown_cached(text, inline)
+
+
+@lru_cache(maxsize=4096)
+def render_markdown_cached(text, inline):
+    """Render and sanitize markdown; values like "**Grammy Award**" repeat across items."""
     # Convert markdown to HTML
-    html = markdown.markdown(str(text))
+    html = md.render(escape_list_markers(text)).strip()
     # Sanitize to only allow safe tags
-    clean_html = bleach.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, strip=True)
+    clean_html = sanitize_html(html)
     # Strip wrapping <p> tags for inline content
     if inline:
-        clean_html = re.sub(r'^<p>(.*)</p>$', r'\1', clean_html.strip(), flags=re.DOTALL)
+        clean_html = WRAPPING_P_RE.sub(r'\1', clean_html.strip())
     return clean_html
 
 
@@ -1,8 +1,8 @@
 """Gemini AI integration for the Top of the Pops app."""
 
 import os
-import json
 import json5
+import orjson
 import re
 from dotenv import load_dotenv
 import google.generativeai as genai
@@ -76,6 +76,54 @@ model_subcategories = genai.GenerativeModel(
 )
 
 
+# Unquoted value after a colon, ending at , } ] or at a line break before a closing bracket.
+# The value is a plain run of non-delimiters and the letter check happens in Python,
+# which avoids the nested quantifiers (and backtracking) of a regex-only check.
+UNQUOTED_VALUE_RE = re.compile(r':\s*(?!["\[\{\s])([^,}\]"\n]+?)(?=\s*\n\s*[}\]]|[,}\]])')
+HAS_LETTER_RE = re.compile(r'[a-zA-Z]')
+
+
+def quote_unquoted_value(match):
+    """Quote a matched bare value if it contains letters (e.g., "9e eeuw")."""
+    value = match.group(1)
+    if HAS_LETTER_RE.search(value):
+        return f': "{value}"'
+    return match.group(0)
+
+
+def extract_json_block(text):
+    """Return the first balanced {...} or [...] in text, or None.
+
+    Strips prose or code fences the model sometimes wraps around its JSON.
+    Brackets inside string literals are ignored.
+    """
+    start = next((i for i, ch in enumerate(text) if ch in '{['), None)
+    if start is None:
+        return None
+
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            depth += 1
+        elif ch in '}]':
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
 def parse_json_response(text):
     """Parse JSON response with fallback for malformed AI output.
 
@@ -83,29 +131,26 @@ def parse_json_response(text):
     """
     # Try standard JSON first
     try:
-        return json.loads(text)
-    except json.JSONDecodeError:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
         pass
 
-    # Fix unquoted values that contain letters (e.g., "9e eeuw", "circa 1500")
-    fixed = text
-    # Pass 1: Fix values ending with , } or ]
-    fixed = re.sub(
-        r':\s*(?!["\[\{])([^,}\]"\n]*[a-zA-Z][^,}\]"\n]*?)([,}\]])',
-        r': "\1"\2',
-        fixed
-    )
-    # Pass 2: Fix values at end of line before closing brace
-    fixed = re.sub(
-        r':\s*(?!["\[\{])([^,}\]"\n]*[a-zA-Z][^,}\]"\n]*?)\s*\n(\s*[}\]])',
-        r': "\1"\n\2',
-        fixed
-    )
+    # Drop anything around the JSON itself (e.g., ```json fences)
+    block = extract_json_block(text)
+    if block is not None and block != text:
+        text = block
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+
+    # Fix unquoted values that contain letters (e.g., "9e eeuw", "circa 1500") in one pass
+    fixed = UNQUOTED_VALUE_RE.sub(quote_unquoted_value, text)
 
     # Try parsing fixed JSON
     try:
-        return json.loads(fixed)
-    except json.JSONDecodeError:
+        return orjson.loads(fixed)
+    except orjson.JSONDecodeError:
         # Last resort: use json5 which is more lenient
         return json5.loads(fixed)
 
@@ -131,7 +176,7 @@ Return a JSON object with:
 Return ONLY the JSON object, no markdown."""
 
     response = model_subcategories.generate_content(prompt)
-    return json.loads(response.text)
+    return orjson.loads(response.text)
 
 
 def generate_suggestions():
@@ -152,7 +197,7 @@ Make them fun, educational, and varied. Keep each suggestion concise (2-6 words)
 Return ONLY the JSON object, no markdown."""
 
     response = model_suggestions.generate_content(prompt)
-    return json.loads(response.text)
+    return orjson.loads(response.text)
 
 
 def generate_item_list(category, count, language_instruction):
@@ -175,33 +220,80 @@ Examples by category:
 Be factual and use commonly accepted rankings. Return ONLY the JSON object, no markdown or other text.{language_instruction}"""
 
     response = model_list.generate_content(prompt)
-    return json.loads(response.text)
+    return orjson.loads(response.text)
 
 
-def generate_item_details(item, category, properties, language, language_instruction):
-    """Generate details for a specific item."""
-    properties_str = ', '.join(properties) if properties else 'relevant characteristics'
+# Formatting rules shared by the details prompts
+DETAILS_JSON_RULES = """IMPORTANT JSON RULES:
+1. ALL string values MUST be in double quotes, including dates, years, and descriptions
+2. For properties with multiple items (like notable_works, top_songs), use JSON arrays: ["Item 1", "Item 2", "Item 3"]
+3. Never use unquoted values - even "9th century" must be "9th century" in quotes"""
+
 
+def details_fields(properties, language, bullet='- '):
+    """Return the prompt lines describing one item's details, each starting with bullet."""
+    properties_str = ', '.join(properties) if properties else 'relevant characteristics'
+    fields = [
+        '"name": Full/official name',
+        '"description": 2-3 sentence summary',
+        f'"properties": Object with values for each of: {properties_str}',
+    ]
     # For non-English languages, request English equivalents for image search
-    english_fields_instruction = ""
     if language != 'en':
-        english_fields_instruction = """
-- "english_name": The standard English name for this item (for image lookup)
-- "english_category": The English translation of the category context"""
+        fields += [
+            '"english_name": The standard English name for this item (for image lookup)',
+            '"english_category": The English translation of the category context',
+        ]
+    return '\n'.join(bullet + field for field in fields)
+
 
+def generate_item_details(item, category, properties, language, language_instruction):
+    """Generate details for a specific item."""
     prompt = f"""Provide details about "{item}" in the context of {category}.
 
 Return a JSON object with:
-- "name": Full/official name
-- "description": 2-3 sentence summary
-- "properties": Object with values for each of: {properties_str}{english_fields_instruction}
+{details_fields(properties, language)}
 
-IMPORTANT JSON RULES:
-1. ALL string values MUST be in double quotes, including dates, years, and descriptions
-2. For properties with multiple items (like notable_works, top_songs), use JSON arrays: ["Item 1", "Item 2", "Item 3"]
-3. Never use unquoted values - even "9th century" must be "9th century" in quotes
+{DETAILS_JSON_RULES}
 
 Be concise and factual. Return ONLY valid JSON.{language_instruction}"""
 
     response = model_details.generate_content(prompt)
     return parse_json_response(response.text)
+
+
+def generate_items_details(items, category, properties, language, language_instruction):
+    """Generate details for several items in one call, keyed by the requested item.
+
+    Each entry echoes its item's number and is matched on it, so an entry Gemini
+    drops or reorders can't shift details onto the wrong item. Items without a
+    matching entry are left out.
+    """
+    items_str = '\n'.join(f'{i}. "{item}"' for i, item in enumerate(items, 1))
+
+    prompt = f"""Provide details about each of these items in the context of {category}:
+{items_str}
+
+Return a JSON object with:
+- "items": An array with exactly {len(items)} objects, one per item above, each with:
+  - "index": The item's number from the list above
+{details_fields(properties, language, bullet='  - ')}
+
+{DETAILS_JSON_RULES}
+
+Be concise and factual. Return ONLY valid JSON.{language_instruction}"""
+
+    response = model_details.generate_content(prompt)
+    result = parse_json_response(response.text)
+
+    details = {}
+    for entry in result.get('items', []):
+        if not isinstance(entry, dict):
+            continue
+        try:
+            index = int(entry.pop('index'))
+        except (KeyError, TypeError, ValueError):
+            continue
+        if 1 <= index <= len(items):
+            details.setdefault(items[index - 1], entry)
+    return details
@@ -2,6 +2,9 @@
 
 import time
 import uuid
+from collections import OrderedDict
+from threading import Event, Lock, Thread
+from cachetools import LRUCache
 from flask import session
 from flask_limiter.util import get_remote_address
 
@@ -9,73 +12,111 @@ from flask_limiter.util import get_remote_address
 SESSION_EXPIRY_SECONDS = 3600  # 1 hour
 MAX_SESSIONS_PER_IP = 5
 MAX_TOTAL_SESSIONS = 1000
-CLEANUP_INTERVAL = 100  # Run cleanup every N requests
+CLEANUP_INTERVAL_SECONDS = 60  # How often the background sweeper runs
+DETAILS_CACHE_SIZE = 128  # Max item details kept per session
 
-# In-memory session storage
+# In-memory session storage. The signed Flask cookie only carries 'session_id';
+# everything else (including details_cache) stays server-side.
 # Structure: {session_id: {'data': {...}, 'ip': '...', 'created_at': timestamp, 'last_access': timestamp}}
-sessions = {}
-request_counter = 0
+# Kept in access order (least recently used first) so expiry and eviction pop from the front.
+sessions = OrderedDict()
+# Per-IP session ids in the same access order: {ip: OrderedDict({session_id: None})}
+ip_index = {}
+sessions_lock = Lock()
+
+
+def new_details_cache():
+    """Create a bounded per-session cache for item details."""
+    return LRUCache(maxsize=DETAILS_CACHE_SIZE)
+
+
+def remove_session(session_id):
+    """Remove a session and its IP index entry. Caller must hold sessions_lock."""
+    removed = sessions.pop(session_id)
+    ip_sessions = ip_index.get(removed['ip'])
+    if ip_sessions is not None:
+        ip_sessions.pop(session_id, None)
+        if not ip_sessions:
+            del ip_index[removed['ip']]
+
+
+def cleanup_expired_sessions(now):
+    """Drop expired and excess sessions. Caller must hold sessions_lock."""
+    # Remove expired sessions; the least recently used are at the front
+    while sessions:
+        oldest_id, oldest = next(iter(sessions.items()))
+        if now - oldest['last_access'] <= SESSION_EXPIRY_SECONDS:
+            break
+        remove_session(oldest_id)
+
+    # If still over limit, remove oldest sessions
+    while len(sessions) > MAX_TOTAL_SESSIONS:
+        remove_session(next(iter(sessions)))
 
 
 def cleanup_sessions():
     """Remove expired sessions and enforce limits."""
-    global sessions
-    now = time.time()
+    with sessions_lock:
+        cleanup_expired_sessions(time.time())
 
-    # Remove expired sessions
-    expired = [sid for sid, s in sessions.items()
-               if now - s['last_access'] > SESSION_EXPIRY_SECONDS]
-    for sid in expired:
-        del sessions[sid]
 
-    # If still over limit, remove oldest sessions
-    if len(sessions) > MAX_TOTAL_SESSIONS:
-        sorted_sessions = sorted(sessions.items(), key=lambda x: x[1]['last_access'])
-        to_remove = len(sessions) - MAX_TOTAL_SESSIONS
-        for sid, _ in sorted_sessions[:to_remove]:
-            del sessions[sid]
+def start_cleanup_thread(interval=CLEANUP_INTERVAL_SECONDS):
+    """Run cleanup_sessions every interval seconds in a daemon thread.
 
+    Returns an Event; set it to stop the thread.
+    """
+    stop = Event()
 
-def get_session_data():
-    """Get or create session data for current user."""
-    global request_counter
+    def sweep():
+        while not stop.wait(interval):
+            cleanup_sessions()
 
-    # Periodic cleanup
-    request_counter += 1
-    if request_counter >= CLEANUP_INTERVAL:
-        request_counter = 0
-        cleanup_sessions()
+    Thread(target=sweep, name='session-cleanup', daemon=True).start()
+    return stop
 
+
+def get_session_data():
+    """Get or create session data for current user."""
     client_ip = get_remote_address()
     now = time.time()
 
-    if 'session_id' not in session:
-        # Check if IP has too many sessions
-        ip_sessions = [s for s in sessions.values() if s['ip'] == client_ip]
-        if len(ip_sessions) >= MAX_SESSIONS_PER_IP:
-            # Remove oldest session for this IP
-            oldest = min(ip_sessions, key=lambda x: x['last_access'])
-            oldest_id = next(sid for sid, s in sessions.items() if s is oldest)
-            del sessions[oldest_id]
-
-        session['session_id'] = str(uuid.uuid4())
-
-    session_id = session['session_id']
-
-    if session_id not in sessions:
-        sessions[session_id] = {
-            'data': {
-                'category': None,
-                'items': [],
-                'properties': [],
-                'details_cache': {}
-            },
-            'ip': client_ip,
-            'created_at': now,
-            'last_access': now
-        }
-    else:
-        # Update last access time
-        sessions[session_id]['last_access'] = now
-
-    return sessions[session_id]['data']
+    with sessions_lock:
+        if 'session_id' not in session:
+            # Check if IP has too many sessions
+            ip_sessions = ip_index.get(client_ip)
+            if ip_sessions and len(ip_sessions) >= MAX_SESSIONS_PER_IP:
+                # Remove oldest session for this IP
+                remove_session(next(iter(ip_sessions)))
+
+            session['session_id'] = str(uuid.uuid4())
+
+        session_id = session['session_id']
+        entry = sessions.get(session_id)
+
+        if entry is None:
+            # Keep the hard cap between sweeps; the front is the least recently used
+            if len(sessions) >= MAX_TOTAL_SESSIONS:
+                remove_session(next(iter(sessions)))
+
+            entry = {
+                'data': {
+                    'category': None,
+                    'items': [],
+                    'properties': [],
+                    'details_cache': new_details_cache(),
+                    # LRUCache reads reorder entries, so every access needs this lock
+                    'details_lock': Lock()
+                },
+                'ip': client_ip,
+                'created_at': now,
+                'last_access': now
+            }
+            sessions[session_id] = entry
+            ip_index.setdefault(client_ip, OrderedDict())[session_id] = None
+        else:
+            # Update last access time and recency
+            entry['last_access'] = now
+            sessions.move_to_end(session_id)
+            ip_index[entry['ip']].move_to_end(session_id)
+
+        return entry['data']
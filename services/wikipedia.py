@@ -1,10 +1,97 @@
 """Wikipedia API integration for fetching images."""
 
+import heapq
+import os
+import re
+from operator import itemgetter
+import orjson
 import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from services.cache import SharedCache
+
+load_dotenv()
 
 # User agent for Wikipedia API requests
 USER_AGENT = 'PopQuiz/1.0 (https://github.com/bavobbr/top-of-the-pops-agent; bavo.bruylandt@gmail.com)'
 API_URL = "https://en.wikipedia.org/w/api.php"
+TIMEOUT = (3, 10)  # (connect, read) seconds
+MAX_TITLES_PER_QUERY = 50  # MediaWiki limit for titles= on a single query
+# Largest API response we parse; normal lookups are well under 100 KB
+MAX_RESPONSE_BYTES = 1024 * 1024
+# Width of the scaled copies we link to; originals can be tens of megabytes
+IMAGE_WIDTH = 1000
+
+# Patterns for generic/irrelevant images (negative scoring)
+GENERIC_PATTERNS = ('map', 'flag', 'chart', 'diagram', 'graph', 'icon',
+                    'location', 'coat_of_arms', 'emblem', 'seal')
+
+# Skip patterns - these are never useful
+SKIP_PATTERNS = ('commons-logo', 'wiki', 'edit-clear', 'symbol_',
+                 'pictogram', 'ambox', 'padlock', 'question',
+                 'crystal', 'folder', 'gnome', 'nuvola',
+                 'red_pencil', 'disambig', 'stub', 'portal',
+                 'p_vip', 'star_full', 'signature', 'autograph',
+                 'wma', 'ogg', 'mid', 'octicons', 'oojs')
+
+# One compiled alternation per pattern set instead of a Python-level any() scan
+GENERIC_RE = re.compile('|'.join(map(re.escape, GENERIC_PATTERNS)))
+SKIP_RE = re.compile('|'.join(map(re.escape, SKIP_PATTERNS)))
+# Words in names and filenames; underscores and punctuation separate words
+TOKEN_RE = re.compile(r'[^\W_]+')
+IMAGE_EXT_RE = re.compile(r'\.(?:jpe?g|png|gif|svg)$')  # jpg, png, gif, and svg (for logos)
+
+# Category keywords -> disambiguation hints, as (substring terms, hints) in priority order
+CATEGORY_HINT_TERMS = (
+    # Music-related categories
+    (('band', 'rock', 'pop', 'music', 'singer', 'artist', 'rapper', 'hip hop'),
+     ('musician', 'band', 'singer', 'musical artist')),
+    # Film/TV categories
+    (('movie', 'film', 'actor', 'actress', 'star', 'hollywood'),
+     ('actor', 'actress', 'film', 'entertainer')),
+    # Sports categories
+    (('sport', 'athlete', 'player', 'olympic', 'champion', 'football', 'basketball', 'tennis'),
+     ('athlete', 'sportsperson', 'player')),
+    # Science/academic categories
+    (('scientist', 'physicist', 'nobel', 'inventor', 'researcher'),
+     ('scientist', 'physicist', 'researcher')),
+    # Historical/political categories
+    (('leader', 'president', 'monarch', 'king', 'queen', 'politician'),
+     ('politician', 'leader', 'monarch')),
+)
+CATEGORY_HINTS = tuple(
+    (re.compile('|'.join(map(re.escape, terms))), hints)
+    for terms, hints in CATEGORY_HINT_TERMS
+)
+
+# Most requests in flight to Wikipedia at once, across all worker threads
+WIKI_MAX_CONNECTIONS = 10
+
+# Shared session so all lookups reuse keep-alive connections to Wikipedia.
+# The pool blocks when full, so bursts (a list prefetch plus user clicks) queue
+# for a connection instead of opening more and getting throttled.
+wiki_session = requests.Session()
+wiki_session.headers['User-Agent'] = USER_AGENT
+# Retry throttling and gateway errors briefly instead of reporting an image 'error';
+# 429 retries wait for the Retry-After header when Wikipedia sends one. Read
+# timeouts are not retried: each one already cost the full TIMEOUT, and tripling it
+# would hold a pooled connection (and a waiting user) far too long
+WIKI_RETRY = Retry(total=2, read=0, backoff_factor=0.2, status_forcelist=(429, 502, 503, 504))
+wiki_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=WIKI_MAX_CONNECTIONS,
+                                           pool_block=True, max_retries=WIKI_RETRY))
+
+# Image lookups are the same for every user, so share results across sessions
+IMAGE_CACHE_SIZE = 2048
+IMAGE_CACHE_TTL_SECONDS = 86400  # 1 day
+
+IMAGE_CACHE_DISK_LIMIT = 100 * 1024 * 1024  # 100 MB
+
+# Set IMAGE_CACHE_DIR to keep image lookups across restarts and cold starts
+IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR')
+
+image_cache = SharedCache(IMAGE_CACHE_DIR, IMAGE_CACHE_SIZE, IMAGE_CACHE_TTL_SECONDS, IMAGE_CACHE_DISK_LIMIT)
 
 
 def get_category_disambiguation_hints(category):
@@ -14,107 +101,125 @@ def get_category_disambiguation_hints(category):
 
     category_lower = category.lower()
 
-    # Music-related categories
-    if any(term in category_lower for term in ['band', 'rock', 'pop', 'music', 'singer', 'artist', 'rapper', 'hip hop']):
-        return ['musician', 'band', 'singer', 'musical artist']
+    # Buckets are checked in priority order; the first with any matching term wins
+    for terms_re, hints in CATEGORY_HINTS:
+        if terms_re.search(category_lower):
+            return list(hints)
 
-    # Film/TV categories
-    if any(term in category_lower for term in ['movie', 'film', 'actor', 'actress', 'star', 'hollywood']):
-        return ['actor', 'actress', 'film', 'entertainer']
+    return []
 
-    # Sports categories
-    if any(term in category_lower for term in ['sport', 'athlete', 'player', 'olympic', 'champion', 'football', 'basketball', 'tennis']):
-        return ['athlete', 'sportsperson', 'player']
 
-    # Science/academic categories
-    if any(term in category_lower for term in ['scientist', 'physicist', 'nobel', 'inventor', 'researcher']):
-        return ['scientist', 'physicist', 'researcher']
+def wiki_get(params, headers):
+    """Query the Wikipedia API and parse the JSON response.
 
-    # Historical/political categories
-    if any(term in category_lower for term in ['leader', 'president', 'monarch', 'king', 'queen', 'politician']):
-        return ['politician', 'leader', 'monarch']
+    The body is streamed and reading stops past MAX_RESPONSE_BYTES, so an
+    unusually large page can't tie up memory; that raises a RequestException.
+    """
+    with wiki_session.get(API_URL, params=params, headers=headers, timeout=TIMEOUT, stream=True) as resp:
+        body = resp.raw.read(MAX_RESPONSE_BYTES + 1, decode_content=True)
+    if len(body) > MAX_RESPONSE_BYTES:
+        raise requests.RequestException(f"Wikipedia response over {MAX_RESPONSE_BYTES} bytes")
+    return orjson.loads(body)
 
-    return []
 
+def search_pages(query, limit, headers):
+    """Search Wikipedia and return the top pages in rank order.
+
+    Uses the search results as a generator so each page comes back with its
+    primary image ('thumbnail', 'original', 'pageimage') and image list
+    ('images') in the same request.
+    """
+    params = {
+        'action': 'query',
+        'generator': 'search',
+        'gsrsearch': query,
+        'gsrlimit': limit,
+        'prop': 'pageimages|images',
+        'piprop': 'thumbnail|original|name',
+        'pithumbsize': IMAGE_WIDTH,
+        'imlimit': 'max',  # Shared across all returned pages
+        'format': 'json'
+    }
+    pages = wiki_get(params, headers).get('query', {}).get('pages', {})
+    return sorted(pages.values(), key=lambda page: page.get('index', 0))
 
-def search_wikipedia_page(item_name, category, headers):
-    """Try multiple search strategies to find the best Wikipedia page."""
-    disambiguation_hints = get_category_disambiguation_hints(category)
 
+def search_strategies(item_name, category):
+    """Yield search queries in the order they should be tried."""
     # Strategy 1: Try exact title match first
-    search_strategies = [
-        item_name,  # Exact name
-    ]
+    yield item_name
 
-    # Strategy 2: Try with disambiguation suffixes
-    for hint in disambiguation_hints[:2]:  # Limit to first 2 hints
-        search_strategies.append(f"{item_name} ({hint})")
+    # Strategy 2: Try with disambiguation suffixes; hints are only worked out
+    # once the exact name has missed
+    for hint in get_category_disambiguation_hints(category)[:2]:  # Limit to first 2 hints
+        yield f"{item_name} ({hint})"
 
     # Strategy 3: Category-enhanced search as fallback
     if category:
-        search_strategies.append(f"{item_name} {category}")
-
-    for query in search_strategies:
-        search_params = {
-            'action': 'query',
-            'list': 'search',
-            'srsearch': query,
-            'format': 'json',
-            'srlimit': 3  # Get a few results to check relevance
-        }
+        yield f"{item_name} {category}"
 
-        try:
-            resp = requests.get(API_URL, params=search_params, headers=headers, timeout=10)
-            data = resp.json()
 
-            results = data.get('query', {}).get('search', [])
-            if not results:
-                continue
+def search_wikipedia_page(item_name, category, headers):
+    """Try multiple search strategies to find the best Wikipedia page.
+
+    A failed search just moves on to the next strategy. If every search fails,
+    the fallback's error is raised so an outage isn't reported (and cached) as
+    a missing page.
+    """
+    item_lower = item_name.lower()
+    # Results per query, so the final fallback can reuse a search already made
+    searched = {}
 
-            # Check if first result title closely matches our item name
-            first_title = results[0]['title'].lower()
-            item_lower = item_name.lower()
-
-            # Good match: title starts with or equals the item name
-            if first_title.startswith(item_lower) or item_lower in first_title:
-                return {
-                    'title': results[0]['title'],
-                    'search_query': query,
-                    'strategy': 'matched'
-                }
-
-            # For disambiguation pages, look at other results
-            if 'disambiguation' in first_title:
-                for result in results[1:]:
-                    if item_lower in result['title'].lower():
-                        return {
-                            'title': result['title'],
-                            'search_query': query,
-                            'strategy': 'disambiguation_resolved'
-                        }
-        except requests.RequestException:
+    for query in search_strategies(item_name, category):
+        try:
+            results = search_pages(query, 3, headers)  # Get a few results to check relevance
+        except (requests.RequestException, orjson.JSONDecodeError):
+            continue
+        searched[query] = results
+        if not results:
             continue
 
-    # Final fallback: just use the first result from original search
-    fallback_query = f"{item_name} {category}" if category else item_name
-    try:
-        resp = requests.get(API_URL, params={
-            'action': 'query',
-            'list': 'search',
-            'srsearch': fallback_query,
-            'format': 'json',
-            'srlimit': 1
-        }, headers=headers, timeout=10)
-        data = resp.json()
-        results = data.get('query', {}).get('search', [])
-        if results:
+        # Check if first result title closely matches our item name
+        first_title = results[0]['title'].lower()
+
+        # Good match: title starts with or equals the item name
+        if first_title.startswith(item_lower) or item_lower in first_title:
             return {
                 'title': results[0]['title'],
-                'search_query': fallback_query,
-                'strategy': 'fallback'
+                'search_query': query,
+                'strategy': 'matched',
+                'page': results[0]
             }
-    except requests.RequestException:
-        pass
+
+        # For disambiguation pages, look at other results
+        if 'disambiguation' in first_title:
+            for result in results[1:]:
+                if item_lower in result['title'].lower():
+                    return {
+                        'title': result['title'],
+                        'search_query': query,
+                        'strategy': 'disambiguation_resolved',
+                        'page': result
+                    }
+
+    # Final fallback: just use the first result from original search
+    fallback_query = f"{item_name} {category}" if category else item_name
+    results = searched.get(fallback_query)
+    if results is None:
+        try:
+            results = search_pages(fallback_query, 1, headers)
+        except (requests.RequestException, orjson.JSONDecodeError):
+            # Every search failed: let the caller report an error
+            if not searched:
+                raise
+            results = []
+    if results:
+        return {
+            'title': results[0]['title'],
+            'search_query': fallback_query,
+            'strategy': 'fallback',
+            'page': results[0]
+        }
 
     return None
 
@@ -123,6 +228,9 @@ def fetch_wikipedia_images(item_name, category=None, max_images=3):
     """
     Fetch images from Wikipedia for the given item, prioritizing the main image.
 
+    Results are cached process-wide per (item_name, category, max_images), ignoring case;
+    lookups that failed with an error are not cached.
+
     Returns a dict with:
         - images: list of image URLs
         - source_page: Wikipedia page title used
@@ -130,6 +238,22 @@ def fetch_wikipedia_images(item_name, category=None, max_images=3):
         - status: 'success' | 'no_page_found' | 'no_images' | 'error'
         - error: error message if status is 'error'
     """
+    # Wikipedia search and image scoring ignore case, so variants share an entry
+    key = (item_name.strip().lower(), (category or '').strip().lower(), max_images)
+    # Callers modify the result, so hand out and store copies of the image list
+    cached = image_cache.get(key)
+    if cached is not None:
+        return dict(cached, images=list(cached['images']))
+
+    result = fetch_wikipedia_images_uncached(item_name, category, max_images)
+
+    if result['status'] != 'error':
+        image_cache.set(key, dict(result, images=list(result['images'])))
+    return result
+
+
+def fetch_wikipedia_images_uncached(item_name, category=None, max_images=3):
+    """Look up images on Wikipedia, bypassing the cache. See fetch_wikipedia_images."""
     result = {
         'images': [],
         'source_page': None,
@@ -150,133 +274,111 @@ def fetch_wikipedia_images(item_name, category=None, max_images=3):
         result['source_page'] = page_title
         result['search_query'] = page_info['search_query']
 
-        # Step 2: Get the PRIMARY page image (the main thumbnail/infobox image)
-        pageimage_params = {
-            'action': 'query',
-            'titles': page_title,
-            'prop': 'pageimages',
-            'piprop': 'original',
-            'format': 'json'
-        }
-
-        pageimage_resp = requests.get(API_URL, params=pageimage_params, headers=headers, timeout=10)
-        pageimage_data = pageimage_resp.json()
+        # The search already returned the page's primary image and image list
+        page_data = page_info['page']
 
-        for page_id, page_data in pageimage_data.get('query', {}).get('pages', {}).items():
-            original = page_data.get('original', {})
-            if original.get('source'):
-                result['images'].append(original['source'])
+        # Step 2: Use the PRIMARY page image (the main thumbnail/infobox image),
+        # scaled down when Wikipedia offers a thumbnail
+        primary = page_data.get('thumbnail') or page_data.get('original') or {}
+        if primary.get('source'):
+            result['images'].append(primary['source'])
+        # File name of the primary image, with underscores for spaces
+        primary_file = page_data.get('pageimage')
 
         if len(result['images']) >= max_images:
             result['status'] = 'success'
             result['images'] = result['images'][:max_images]
             return result
 
-        # Step 3: Get additional images with improved relevance scoring
-        images_params = {
-            'action': 'query',
-            'titles': page_title,
-            'prop': 'images',
-            'format': 'json',
-            'imlimit': 30
-        }
-
-        images_resp = requests.get(API_URL, params=images_params, headers=headers, timeout=10)
-        images_data = images_resp.json()
-
-        pages = images_data.get('query', {}).get('pages', {})
-
+        # Step 3: Score the additional images for relevance
         # Prepare search terms - include ALL name parts regardless of length
-        name_parts = [p.lower() for p in item_name.split()]
-
-        # Patterns for generic/irrelevant images (negative scoring)
-        generic_patterns = ['map', 'flag', 'chart', 'diagram', 'graph', 'icon',
-                           'location', 'coat_of_arms', 'emblem', 'seal']
-
-        # Skip patterns - these are never useful
-        skip_patterns = ['commons-logo', 'wiki', 'edit-clear', 'symbol_',
-                        'pictogram', 'ambox', 'padlock', 'question',
-                        'crystal', 'folder', 'gnome', 'nuvola',
-                        'red_pencil', 'disambig', 'stub', 'portal',
-                        'p_vip', 'star_full', 'signature', 'autograph',
-                        'wma', 'ogg', 'mid', 'octicons', 'oojs']
+        item_lower = item_name.lower()
+        name_parts = TOKEN_RE.findall(item_lower)
+        name_set = set(name_parts)
+        # First word/last word bonus for people (typically first or last name)
+        bonus_parts = (name_parts[0], name_parts[-1]) if len(name_parts) >= 2 else ()
 
         # Collect and score images
         scored_images = []
 
-        for page_id, page_data in pages.items():
-            for img in page_data.get('images', []):
-                img_title = img['title']
-                lower_title = img_title.lower()
-
-                # Skip common non-content images
-                if any(pattern in lower_title for pattern in skip_patterns):
-                    continue
-
-                # Allow jpg, png, gif, and svg (for logos)
-                if not any(ext in lower_title for ext in ['.jpg', '.jpeg', '.png', '.gif', '.svg']):
-                    continue
+        for img in page_data.get('images', []):
+            img_title = img['title']
+            lower_title = img_title.lower()
 
-                # Skip svg icons but allow svg logos
-                if '.svg' in lower_title and 'logo' not in lower_title:
-                    continue
+            # Skip common non-content images and anything but jpg, png, gif,
+            # and svg logos (other svgs are icons)
+            if (SKIP_RE.search(lower_title)
+                    or not IMAGE_EXT_RE.search(lower_title)
+                    or (lower_title.endswith('.svg') and 'logo' not in lower_title)):
+                continue
 
-                # Score based on how many name parts appear in filename
-                score = sum(1 for part in name_parts if part in lower_title)
+            # The primary image is already in the result, at a different thumbnail size
+            if primary_file and img_title.partition(':')[2].replace(' ', '_') == primary_file:
+                continue
 
-                # Exact match bonus
-                if item_name.lower() in lower_title:
-                    score += 5
+            # Score based on how many name parts appear as words in the filename
+            title_tokens = set(TOKEN_RE.findall(lower_title))
+            score = len(name_set & title_tokens)
 
-                # First word/last word bonus for people (typically first or last name)
-                if len(name_parts) >= 2:
-                    if name_parts[0] in lower_title:
-                        score += 1
-                    if name_parts[-1] in lower_title:
-                        score += 1
+            # Exact match bonus
+            if item_lower in lower_title:
+                score += 5
 
-                # Negative scoring for generic images
-                if any(pattern in lower_title for pattern in generic_patterns):
-                    score -= 3
+            for part in bonus_parts:
+                if part in title_tokens:
+                    score += 1
 
-                scored_images.append((score, img_title))
+            # Negative scoring for generic images
+            if GENERIC_RE.search(lower_title):
+                score -= 3
 
-        # Sort by score (highest first) and get URLs
-        scored_images.sort(key=lambda x: -x[0])
+            scored_images.append((score, img_title))
 
-        for score, img_title in scored_images:
-            if len(result['images']) >= max_images:
-                break
+        # Take the best-scored candidates (highest first); nlargest keeps ties in
+        # page order like the stable sort it replaces
+        top_images = heapq.nlargest(MAX_TITLES_PER_QUERY, scored_images, key=itemgetter(0))
+        candidates = [img_title for score, img_title in top_images]
 
-            # Get image info with dimensions
+        if candidates and len(result['images']) < max_images:
+            # Resolve all candidates in one batched imageinfo query
             imageinfo_params = {
                 'action': 'query',
-                'titles': img_title,
+                'titles': '|'.join(candidates),
                 'prop': 'imageinfo',
                 'iiprop': 'url|size',
+                'iiurlwidth': IMAGE_WIDTH,
                 'format': 'json'
             }
 
-            info_resp = requests.get(API_URL, params=imageinfo_params, headers=headers, timeout=10)
-            info_data = info_resp.json()
+            info_data = wiki_get(imageinfo_params, headers).get('query', {})
 
-            for page_id, page_data in info_data.get('query', {}).get('pages', {}).items():
+            # The API may normalize titles and returns pages unordered, so index by title
+            normalized = {n['from']: n['to'] for n in info_data.get('normalized', [])}
+            info_by_title = {}
+            for page_data in info_data.get('pages', {}).values():
                 imageinfo = page_data.get('imageinfo', [])
                 if imageinfo:
-                    img_info = imageinfo[0]
-                    url = img_info.get('url')
-                    width = img_info.get('width', 0)
-                    height = img_info.get('height', 0)
-
-                    # Skip tiny icons (< 100px) or huge files (> 5000px)
-                    if width < 100 or height < 100:
-                        continue
-                    if width > 5000 or height > 5000:
-                        continue
-
-                    if url and url not in result['images']:
-                        result['images'].append(url)
-                        break
+                    info_by_title[page_data.get('title')] = imageinfo[0]
+
+            for img_title in candidates:
+                if len(result['images']) >= max_images:
+                    break
+
+                img_info = info_by_title.get(normalized.get(img_title, img_title))
+                if not img_info:
+                    continue
+
+                # Link the scaled copy, so huge originals are fine to use
+                url = img_info.get('thumburl') or img_info.get('url')
+                width = img_info.get('width', 0)
+                height = img_info.get('height', 0)
+
+                # Skip tiny icons (< 100px)
+                if width < 100 or height < 100:
+                    continue
+
+                if url and url not in result['images']:
+                    result['images'].append(url)
 
         # Set final status
         if result['images']:
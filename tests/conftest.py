@@ -1,6 +1,7 @@
 """Pytest configuration and fixtures."""
 
 import pytest
+import socket
 import sys
 import os
 
@@ -9,6 +10,24 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import app as flask_app
 
+# Modules allowed to reach real services
+NETWORK_TEST_MODULES = {'test_integration'}
+
+
+@pytest.fixture(autouse=True)
+def no_network(request, monkeypatch):
+    """Fail fast when a unit test opens a real connection instead of using a mock."""
+    if request.module.__name__.rpartition('.')[2] in NETWORK_TEST_MODULES:
+        return
+
+    def blocked(*args, **kwargs):
+        # pytest.fail raises a BaseException, so the services' broad except clauses can't swallow it
+        pytest.fail("Unit tests must not open network connections; mock the request instead")
+
+    # Name lookup comes before connect(), and offline it would fail first, so block both
+    monkeypatch.setattr(socket, 'getaddrinfo', blocked)
+    monkeypatch.setattr(socket.socket, 'connect', blocked)
+
 
 @pytest.fixture
 def app():
@@ -0,0 +1,319 @@
+"""Unit tests for app.py routes, with Gemini and Wikipedia mocked."""
+
+import pytest
+from concurrent.futures import Future
+import app as app_module
+from app import parse_count, parse_language, MIN_COUNT, MAX_COUNT
+from services import cache, sessions
+
+
+@pytest.fixture(autouse=True)
+def no_rate_limits(monkeypatch):
+    """Keep per-minute limits from failing tests that share the in-memory limiter."""
+    monkeypatch.setattr(app_module.limiter, 'enabled', False)
+
+
+@pytest.fixture(autouse=True)
+def clear_state():
+    """Start each test with no sessions and empty shared caches."""
+    def clear():
+        sessions.sessions.clear()
+        sessions.ip_index.clear()
+        cache.shared_details_cache.clear()
+        cache.shared_lists_cache.clear()
+        cache.image_futures.clear()
+        cache.details_inflight.clear()
+    clear()
+    yield
+    clear()
+
+
+@pytest.fixture
+def image_calls(monkeypatch):
+    """Record (item, category) for each Wikipedia image fetch."""
+    calls = []
+
+    def fetch(item, category=None):
+        calls.append((item, category))
+        return {'images': [f'https://example.com/{item}.jpg'], 'source_page': item, 'status': 'success'}
+
+    monkeypatch.setattr(app_module, 'fetch_wikipedia_images', fetch)
+    return calls
+
+
+def details_for(item, **extra):
+    """Build a Gemini details result for item."""
+    return dict({'name': item, 'description': f'About {item}', 'properties': {}}, **extra)
+
+
+class TestParseCount:
+    """Tests for parse_count function."""
+
+    def test_integer_values(self):
+        """Integers and integer strings within range should pass through."""
+        assert parse_count(10) == 10
+        assert parse_count("12") == 12
+
+    def test_clamps_to_range(self):
+        """Counts outside the allowed range should be clamped."""
+        assert parse_count(0) == MIN_COUNT
+        assert parse_count(1000) == MAX_COUNT
+
+    def test_non_integer_returns_none(self):
+        """Values that aren't integers should be rejected."""
+        assert parse_count("lots") is None
+        assert parse_count(None) is None
+        assert parse_count([5]) is None
+
+
+class TestParseLanguage:
+    """Tests for parse_language function."""
+
+    def test_supported_language(self):
+        """Supported codes should pass through."""
+        assert parse_language("nl") == "nl"
+
+    def test_unsupported_language_defaults_to_english(self):
+        """Unknown or non-string codes should fall back to English."""
+        assert parse_language("xx") == "en"
+        assert parse_language(None) == "en"
+        assert parse_language(["nl"]) == "en"
+
+
+class TestGenerateListValidation:
+    """Request validation for /api/generate-list."""
+
+    def test_generate_list_malformed_body(self, client):
+        """Should return error for a body that isn't a JSON object."""
+        response = client.post('/api/generate-list', data='not json',
+                               content_type='application/json')
+        assert response.status_code == 400
+        assert 'error' in response.get_json()
+
+    def test_generate_list_requires_json_content_type(self, client):
+        """A JSON body sent as text/plain should be rejected."""
+        response = client.post('/api/generate-list', data='{"category": "rock bands"}',
+                               content_type='text/plain')
+        assert response.status_code == 400
+
+    def test_generate_list_invalid_count(self, client):
+        """Should return error for a non-integer count."""
+        response = client.post('/api/generate-list', json={
+            'category': 'rock bands',
+            'count': 'lots'
+        })
+        assert response.status_code == 400
+
+
+class TestGenerateListCache:
+    """Tests for /api/generate-list sharing lists through the list cache."""
+
+    def test_cached_list_skips_gemini(self, client, monkeypatch, image_calls):
+        """A list already generated by another session should be served as is."""
+        cached = {'items': ['Queen', 'Abba'], 'properties': ['genre']}
+        cache.set_shared_list(cache.make_list_key('rock bands', 2, 'en'), cached)
+
+        def fail(*args):
+            raise AssertionError('Gemini should not be called')
+        monkeypatch.setattr(app_module, 'generate_item_list', fail)
+
+        response = client.post('/api/generate-list', json={'category': 'rock bands', 'count': 2})
+
+        assert response.status_code == 200
+        assert response.get_json() == cached
+
+    def test_empty_list_not_cached(self, client, monkeypatch, image_calls):
+        """A reply without items shouldn't be shared with later requests."""
+        monkeypatch.setattr(app_module, 'generate_item_list',
+                            lambda *args: {'items': [], 'properties': ['genre']})
+
+        client.post('/api/generate-list', json={'category': 'rock bands', 'count': 2})
+
+        assert cache.get_shared_list(cache.make_list_key('rock bands', 2, 'en')) is None
+
+
+class TestOriginCheck:
+    """Tests for cross-origin request blocking."""
+
+    def test_same_origin_allowed(self, client):
+        """Requests whose Origin matches the host should pass."""
+        response = client.get('/api/broad-categories', headers={'Origin': 'http://localhost'})
+        assert response.status_code == 200
+
+    def test_cross_origin_blocked(self, client):
+        """Requests from another origin should be rejected."""
+        response = client.get('/api/broad-categories', headers={'Origin': 'https://evil.example.com'})
+        assert response.status_code == 403
+        assert response.get_json()['error'] == 'forbidden'
+
+
+class TestSuggestions:
+    """Tests for /api/suggestions."""
+
+    def test_matching_etag_returns_304(self, client, monkeypatch):
+        """Clients revalidating with the current ETag should get a 304."""
+        monkeypatch.setattr(app_module, 'generate_suggestions', lambda: {'suggestions': ['rock bands']})
+        app_module.suggestions_cache.clear()
+
+        first = client.get('/api/suggestions')
+        second = client.get('/api/suggestions', headers={'If-None-Match': first.headers['ETag']})
+
+        assert first.get_json() == {'suggestions': ['rock bands']}
+        assert second.status_code == 304
+        app_module.suggestions_cache.clear()
+
+
+    def test_waiter_shares_failed_refresh(self, client, monkeypatch):
+        """A request queued behind a failing refresh should fall back without calling Gemini."""
+        def generate():
+            raise AssertionError("waiter must not call Gemini")
+        monkeypatch.setattr(app_module, 'generate_suggestions', generate)
+        app_module.suggestions_cache.clear()
+        pending = Future()
+        pending.set_exception(RuntimeError("Gemini unavailable"))
+        monkeypatch.setattr(app_module, 'suggestions_refresh', pending)
+
+        response = client.get('/api/suggestions')
+
+        assert response.get_json() == {'suggestions': list(app_module.FALLBACK_SUGGESTIONS)}
+
+    def test_failed_refresh_is_retried_later(self, client, monkeypatch):
+        """A failed refresh shouldn't block the next request from trying again."""
+        calls = []
+
+        def generate():
+            calls.append(1)
+            raise RuntimeError("Gemini unavailable")
+        monkeypatch.setattr(app_module, 'generate_suggestions', generate)
+        app_module.suggestions_cache.clear()
+
+        client.get('/api/suggestions')
+        client.get('/api/suggestions')
+
+        assert len(calls) == 2
+        assert app_module.suggestions_refresh is None
+
+
+class TestGetItemDetails:
+    """Tests for /api/get-item-details."""
+
+    def test_english_searches_item_name(self, client, monkeypatch, image_calls):
+        """English sessions should search Wikipedia with the item name."""
+        monkeypatch.setattr(app_module, 'generate_item_details', lambda item, *args: details_for(item))
+
+        response = client.post('/api/get-item-details', json={'item': 'Paris', 'category': 'capitals'})
+
+        assert response.status_code == 200
+        assert image_calls == [('Paris', 'capitals')]
+        assert response.get_json()['images'] == ['https://example.com/Paris.jpg']
+
+    def test_translated_item_searches_english_name(self, client, monkeypatch, image_calls):
+        """Other languages should search Wikipedia only with the English names."""
+        monkeypatch.setattr(
+            app_module, 'generate_item_details',
+            lambda item, *args: details_for(item, english_name='Paris', english_category='capitals')
+        )
+
+        response = client.post('/api/get-item-details',
+                               json={'item': 'Parijs', 'category': 'hoofdsteden', 'language': 'nl'})
+
+        data = response.get_json()
+        assert image_calls == [('Paris', 'capitals')]
+        assert data['images'] == ['https://example.com/Paris.jpg']
+        assert 'english_name' not in data
+
+
+class TestSharedDetailsLookup:
+    """Tests for the cross-session in-flight lookup in /api/get-item-details."""
+
+    KEY = cache.make_details_key('Paris', 'capitals', [], 'en')
+
+    def test_owner_generates_and_releases(self, client, monkeypatch, image_calls):
+        """The first request should generate, share and then release the lookup."""
+        calls = []
+
+        def generate(item, *args):
+            calls.append(item)
+            return details_for(item)
+        monkeypatch.setattr(app_module, 'generate_item_details', generate)
+
+        response = client.post('/api/get-item-details', json={'item': 'Paris', 'category': 'capitals'})
+
+        assert response.get_json()['name'] == 'Paris'
+        assert calls == ['Paris']
+        assert cache.get_shared_details(self.KEY)['name'] == 'Paris'
+        assert cache.details_inflight == {}
+
+    def test_waiter_uses_owner_result(self, client, monkeypatch):
+        """A request for details already being generated should wait for them."""
+        def generate(item, *args):
+            raise AssertionError("waiter must not call Gemini")
+        monkeypatch.setattr(app_module, 'generate_item_details', generate)
+        pending, is_owner = cache.claim_details_lookup(self.KEY)
+        pending.set_result(details_for('Paris', images=[]))
+
+        response = client.post('/api/get-item-details', json={'item': 'Paris', 'category': 'capitals'})
+
+        assert is_owner
+        assert response.status_code == 200
+        assert response.get_json()['name'] == 'Paris'
+        # Only the owner releases the lookup
+        assert self.KEY in cache.details_inflight
+
+    def test_owner_error_is_released(self, client, monkeypatch, image_calls):
+        """A failed lookup should return 500 and let the next request retry."""
+        def generate(item, *args):
+            raise ValueError("bad JSON")
+        monkeypatch.setattr(app_module, 'generate_item_details', generate)
+
+        response = client.post('/api/get-item-details', json={'item': 'Paris', 'category': 'capitals'})
+
+        assert response.status_code == 500
+        assert response.get_json()['error'] == 'bad JSON'
+        assert cache.details_inflight == {}
+
+    def test_waiter_gets_owner_error(self, client):
+        """Waiters should see the owner's error instead of hanging."""
+        pending, _ = cache.claim_details_lookup(self.KEY)
+        pending.set_exception(ValueError("bad JSON"))
+
+        response = client.post('/api/get-item-details', json={'item': 'Paris', 'category': 'capitals'})
+
+        assert response.status_code == 500
+        assert response.get_json()['error'] == 'bad JSON'
+
+
+class TestGetItemDetailsBatch:
+    """Tests for /api/get-item-details-batch."""
+
+    def test_results_keyed_by_requested_item(self, client, monkeypatch, image_calls):
+        """Each item should get its own details even when Gemini drops one."""
+        monkeypatch.setattr(app_module, 'generate_items_details',
+                            lambda items, *args: {'Berlin': details_for('Berlin')})
+
+        response = client.post('/api/get-item-details-batch',
+                               json={'items': ['Rome', 'Berlin'], 'category': 'capitals'})
+
+        items = response.get_json()['items']
+        assert list(items) == ['Berlin']
+        assert items['Berlin']['name'] == 'Berlin'
+
+    def test_partial_batch_shares_returned_items(self, client, monkeypatch, image_calls):
+        """Items Gemini did answer should be shared even when others were dropped."""
+        monkeypatch.setattr(app_module, 'generate_items_details',
+                            lambda items, *args: {'Berlin': details_for('Berlin')})
+
+        client.post('/api/get-item-details-batch', json={'items': ['Rome', 'Berlin'], 'category': 'capitals'})
+
+        assert cache.get_shared_details(cache.make_details_key('Berlin', 'capitals', [], 'en'))['name'] == 'Berlin'
+        assert cache.get_shared_details(cache.make_details_key('Rome', 'capitals', [], 'en')) is None
+
+    def test_complete_batch_shared(self, client, monkeypatch, image_calls):
+        """A full batch should be shared with other sessions."""
+        monkeypatch.setattr(app_module, 'generate_items_details',
+                            lambda items, *args: {item: details_for(item) for item in items})
+
+        client.post('/api/get-item-details-batch', json={'items': ['Rome', 'Berlin'], 'category': 'capitals'})
+
+        key = cache.make_details_key('Rome', 'capitals', [], 'en')
+        assert cache.get_shared_details(key)['name'] == 'Rome'
@@ -0,0 +1,197 @@
+"""Unit tests for services/cache.py."""
+
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from services.cache import (
+    make_details_key,
+    get_shared_details,
+    set_shared_details,
+    get_or_submit_image_fetch,
+    claim_details_lookup,
+    release_details_lookup,
+    make_list_key,
+    get_shared_list,
+    set_shared_list,
+    shared_details_cache,
+    shared_lists_cache,
+    image_futures,
+    details_inflight
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Start each test with an empty shared cache."""
+    shared_details_cache.clear()
+    shared_lists_cache.clear()
+    image_futures.clear()
+    details_inflight.clear()
+    yield
+    shared_details_cache.clear()
+    shared_lists_cache.clear()
+    image_futures.clear()
+    details_inflight.clear()
+
+
+class TestMakeDetailsKey:
+    """Tests for make_details_key function."""
+
+    def test_same_inputs_same_key(self):
+        """Identical inputs should produce identical keys."""
+        key1 = make_details_key("Paris", "European capitals", ["country"], "en")
+        key2 = make_details_key("Paris", "European capitals", ["country"], "en")
+        assert key1 == key2
+
+    def test_language_changes_key(self):
+        """Different languages should not share cached details."""
+        key_en = make_details_key("Paris", "European capitals", ["country"], "en")
+        key_nl = make_details_key("Paris", "European capitals", ["country"], "nl")
+        assert key_en != key_nl
+
+    def test_properties_change_key(self):
+        """Different property lists should not share cached details."""
+        key1 = make_details_key("Paris", "capitals", ["country"], "en")
+        key2 = make_details_key("Paris", "capitals", ["population"], "en")
+        assert key1 != key2
+
+    def test_fields_do_not_run_together(self):
+        """Moving text between fields should change the key."""
+        key1 = make_details_key("ab", "c", [], "en")
+        key2 = make_details_key("a", "bc", [], "en")
+        assert key1 != key2
+
+
+class TestSharedDetails:
+    """Tests for the shared details cache helpers."""
+
+    def test_miss_returns_none(self):
+        """Unknown keys should return None."""
+        assert get_shared_details("missing") is None
+
+    def test_set_then_get(self):
+        """Stored details should be returned on lookup."""
+        result = {"name": "Paris", "images": []}
+        set_shared_details("key", result)
+        assert get_shared_details("key") == result
+
+
+class TestSharedLists:
+    """Tests for the cross-session generated list cache."""
+
+    def test_key_ignores_case_and_spacing(self):
+        """Categories differing only in case or outer spaces should share a key."""
+        assert make_list_key(" Rock Bands ", 10, "en") == make_list_key("rock bands", 10, "en")
+
+    def test_count_and_language_change_key(self):
+        """Different counts or languages should not share a list."""
+        key = make_list_key("rock bands", 10, "en")
+        assert key != make_list_key("rock bands", 20, "en")
+        assert key != make_list_key("rock bands", 10, "nl")
+
+    def test_set_then_get(self):
+        """Stored lists should be returned for the same key."""
+        key = make_list_key("rock bands", 10, "en")
+        assert get_shared_list(key) is None
+        set_shared_list(key, {"items": ["Queen"], "properties": ["genre"]})
+        assert get_shared_list(key) == {"items": ["Queen"], "properties": ["genre"]}
+
+
+class TestGetOrSubmitImageFetch:
+    """Tests for get_or_submit_image_fetch function."""
+
+    def test_reuses_started_fetch(self):
+        """A second request for the same item should reuse the first future."""
+        calls = []
+
+        def fetch(item, category=None):
+            calls.append(item)
+            return {"status": "success", "images": []}
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            first = get_or_submit_image_fetch(pool, fetch, "Paris", "capitals")
+            second = get_or_submit_image_fetch(pool, fetch, "Paris", "capitals")
+            assert first is second
+            assert first.result()["status"] == "success"
+        assert calls == ["Paris"]
+
+    def test_case_variants_share_fetch(self):
+        """Requests differing only in case or spacing should share one fetch."""
+        calls = []
+
+        def fetch(item, category=None):
+            calls.append(item)
+            return {"status": "success", "images": []}
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            first = get_or_submit_image_fetch(pool, fetch, "Paris", "Capitals")
+            second = get_or_submit_image_fetch(pool, fetch, " paris", "capitals ")
+            assert first is second
+        assert calls == ["Paris"]
+
+    def test_live_request_takes_over_queued_prefetch(self):
+        """A fetch only queued behind a busy pool should move to the caller's pool."""
+        release = Event()
+
+        def fetch(item, category=None):
+            return {"status": "success", "images": [item]}
+
+        with ThreadPoolExecutor(max_workers=1) as prefetch, ThreadPoolExecutor(max_workers=1) as live:
+            prefetch.submit(release.wait)  # Keeps the prefetch pool busy
+            queued = get_or_submit_image_fetch(prefetch, fetch, "Paris", "capitals")
+
+            taken = get_or_submit_image_fetch(live, fetch, "Paris", "capitals")
+
+            assert taken is not queued
+            assert queued.cancelled()
+            assert taken.result(timeout=5)["images"] == ["Paris"]
+            release.set()
+
+    def test_same_pool_keeps_queued_fetch(self):
+        """A fetch queued on the caller's own pool should be reused, not requeued."""
+        release = Event()
+
+        def fetch(item, category=None):
+            return {"status": "success", "images": []}
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pool.submit(release.wait)
+            first = get_or_submit_image_fetch(pool, fetch, "Paris", "capitals")
+            second = get_or_submit_image_fetch(pool, fetch, "Paris", "capitals")
+            assert first is second
+            release.set()
+
+    def test_retries_after_error(self):
+        """A finished fetch with an error status should be replaced."""
+        statuses = iter(["error", "success"])
+
+        def fetch(item, category=None):
+            return {"status": next(statuses), "images": []}
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            first = get_or_submit_image_fetch(pool, fetch, "Paris", "capitals")
+            assert first.result()["status"] == "error"
+            second = get_or_submit_image_fetch(pool, fetch, "Paris", "capitals")
+            assert second.result()["status"] == "success"
+
+
+class TestClaimDetailsLookup:
+    """Tests for claim_details_lookup and release_details_lookup."""
+
+    def test_first_caller_owns_lookup(self):
+        """Later callers should share the owner's future."""
+        future1, owner1 = claim_details_lookup("key")
+        future2, owner2 = claim_details_lookup("key")
+        assert owner1 is True
+        assert owner2 is False
+        assert future1 is future2
+
+    def test_release_allows_new_lookup(self):
+        """After release, the next caller should start a fresh lookup."""
+        future1, _ = claim_details_lookup("key")
+        future1.set_result({})
+        release_details_lookup("key")
+
+        future2, owner2 = claim_details_lookup("key")
+        assert owner2 is True
+        assert future2 is not future1
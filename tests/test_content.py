@@ -3,6 +3,7 @@
 import pytest
 from services.content import (
     render_markdown,
+    sanitize_html,
     render_markdown_in_result,
     get_language_instruction,
     SUPPORTED_LANGUAGES
@@ -37,6 +38,36 @@ class TestRenderMarkdown:
         result = render_markdown("**bold** text", inline=True)
         assert result == "<strong>bold</strong> text"
 
+    def test_plain_value_inline(self):
+        """Plain values with no markdown should come back unchanged."""
+        assert render_markdown("Tokyo, Japan", inline=True) == "Tokyo, Japan"
+        assert render_markdown(1975, inline=True) == "1975"
+
+    def test_plain_value_with_punctuation(self):
+        """Values with inert punctuation should skip rendering unchanged."""
+        assert render_markdown("3.2 million (2020)", inline=True) == "3.2 million (2020)"
+        assert render_markdown("Rock-pop", inline=True) == "Rock-pop"
+
+    def test_years_are_not_list_markers(self):
+        """Years followed by a period or parenthesis should keep their text."""
+        assert render_markdown("1975.") == "<p>1975.</p>"
+        assert render_markdown("1975.", inline=True) == "1975."
+        assert render_markdown("1066) Hastings", inline=True) == "1066) Hastings"
+
+    def test_bare_markers_kept_with_markdown(self):
+        """Bare markers in values that need rendering should keep their text too."""
+        assert render_markdown("1066) *Hastings*", inline=True) == "1066) <em>Hastings</em>"
+        assert render_markdown("1975.\n\n**Rock**") == "<p>1975.</p>\n<p><strong>Rock</strong></p>"
+
+    def test_list_markers_still_rendered(self):
+        """Real list items should still go through markdown."""
+        assert "<ol>" in render_markdown("1. Queen")
+        assert "<ul>" in render_markdown("- Queen")
+
+    def test_special_characters_escaped(self):
+        """Values outside the plain-text fast path should still be escaped."""
+        assert render_markdown("Tom & Jerry", inline=True) == "Tom &amp; Jerry"
+
     def test_unordered_list(self):
         """Unordered lists should render properly."""
         result = render_markdown("- Item 1\n- Item 2")
@@ -66,6 +97,38 @@ class TestRenderMarkdown:
         assert "javascript:" not in result
 
 
+class TestSanitizeHtml:
+    """Tests for sanitize_html function."""
+
+    def test_keeps_allowed_tags(self):
+        """Allowed tags should pass through."""
+        assert sanitize_html("<p><strong>a</strong> <em>b</em></p>") == "<p><strong>a</strong> <em>b</em></p>"
+
+    def test_strips_attributes(self):
+        """Allowed tags should lose all attributes."""
+        assert sanitize_html('<b onclick="alert(1)">x</b>') == "<b>x</b>"
+
+    def test_drops_disallowed_tags_keeps_text(self):
+        """Disallowed tags should be removed but their text kept."""
+        assert sanitize_html('<div><a href="x">link</a></div>') == "link"
+
+    def test_escapes_reassembled_tags(self):
+        """Removing a tag must not leave a new tag behind."""
+        result = sanitize_html("<<x>script>alert(1)<</x>/script>")
+        assert "<script>" not in result
+        assert "&lt;script&gt;" in result
+
+    def test_drops_comments(self):
+        """HTML comments should be removed."""
+        assert sanitize_html("<!-- hidden -->shown") == "shown"
+
+    def test_balances_tags(self):
+        """Unclosed tags should be closed and stray end tags dropped."""
+        assert sanitize_html("<b>bold") == "<b>bold</b>"
+        assert sanitize_html("text</em>") == "text"
+        assert sanitize_html("<b><i>x</b>") == "<b><i>x</i></b>"
+
+
 class TestRenderMarkdownInResult:
     """Tests for render_markdown_in_result function."""
 
@@ -1,7 +1,15 @@
 """Unit tests for services/gemini.py."""
 
 import pytest
-from services.gemini import parse_json_response
+from types import SimpleNamespace
+from services import gemini
+from services.gemini import parse_json_response, generate_items_details
+
+
+def mock_details_model(monkeypatch, text):
+    """Make model_details answer every prompt with text."""
+    model = SimpleNamespace(generate_content=lambda prompt: SimpleNamespace(text=text))
+    monkeypatch.setattr(gemini, 'model_details', model)
 
 
 class TestParseJsonResponse:
@@ -122,8 +130,48 @@ class TestParseJsonResponse:
         assert result["name"] == "Test"
         assert result["value"] == 42
 
+    def test_code_fenced_json(self):
+        """Should strip markdown code fences around the JSON."""
+        text = '```json\n{"name": "Test", "tags": ["a]", "{b"]}\n```'
+        result = parse_json_response(text)
+        assert result == {"name": "Test", "tags": ["a]", "{b"]}
+
+    def test_prose_around_unquoted_value(self):
+        """Should repair values after stripping surrounding text."""
+        text = 'Here you go: {"founded": 9th century}. Enjoy!'
+        result = parse_json_response(text)
+        assert result["founded"] == "9th century"
+
     def test_invalid_json_raises(self):
         """Should raise error for completely invalid JSON."""
         text = 'not json at all'
         with pytest.raises((ValueError, Exception)):
             parse_json_response(text)
+
+
+class TestGenerateItemsDetails:
+    """Tests for generate_items_details function with a mocked model."""
+
+    def test_entries_matched_by_index(self, monkeypatch):
+        """Entries should be matched to items by number, not by position."""
+        mock_details_model(monkeypatch, '{"items": ['
+                           '{"index": 2, "name": "Berlin"}, {"index": 1, "name": "Rome"}]}')
+
+        result = generate_items_details(["Rome", "Berlin"], "capitals", [], "en", "")
+
+        assert result == {"Rome": {"name": "Rome"}, "Berlin": {"name": "Berlin"}}
+
+    def test_dropped_entry_is_left_out(self, monkeypatch):
+        """An item Gemini skipped shouldn't get another item's details."""
+        mock_details_model(monkeypatch, '{"items": [{"index": 2, "name": "Berlin"}]}')
+
+        result = generate_items_details(["Rome", "Berlin"], "capitals", [], "en", "")
+
+        assert result == {"Berlin": {"name": "Berlin"}}
+
+    def test_entries_without_valid_index_ignored(self, monkeypatch):
+        """Entries with a missing or out-of-range number should be dropped."""
+        mock_details_model(monkeypatch, '{"items": ['
+                           '{"name": "Rome"}, {"index": 5, "name": "Oslo"}, "Berlin"]}')
+
+        assert generate_items_details(["Rome", "Berlin"], "capitals", [], "en", "") == {}
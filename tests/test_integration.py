@@ -200,6 +200,34 @@ class TestGetItemDetailsEndpoint:
         assert response1.get_json() == response2.get_json()
 
 
+class TestGetItemDetailsBatchEndpoint:
+    """Integration tests for /api/get-item-details-batch endpoint."""
+
+    def test_batch_details_success(self, client):
+        """Should return details keyed by each requested item."""
+        response = client.post('/api/get-item-details-batch', json={
+            'items': ['Paris', 'Berlin'],
+            'category': 'European capitals',
+            'properties': ['population', 'country'],
+            'language': 'en'
+        })
+        assert response.status_code == 200
+
+        data = response.get_json()
+        assert set(data['items']) <= {'Paris', 'Berlin'}
+        for details in data['items'].values():
+            assert 'description' in details
+            assert 'images' in details
+
+    def test_batch_details_missing_items(self, client):
+        """Should return error when no items are given."""
+        response = client.post('/api/get-item-details-batch', json={
+            'category': 'European capitals'
+        })
+        assert response.status_code == 400
+        assert 'error' in response.get_json()
+
+
 class TestBroadCategoriesEndpoint:
     """Tests for /api/broad-categories endpoint."""
 
@@ -0,0 +1,123 @@
+"""Unit tests for services/sessions.py."""
+
+import time
+import pytest
+from services import sessions
+from services.sessions import get_session_data, cleanup_sessions, start_cleanup_thread
+
+
+@pytest.fixture(autouse=True)
+def clear_sessions():
+    """Start each test with no stored sessions."""
+    sessions.sessions.clear()
+    sessions.ip_index.clear()
+    yield
+    sessions.sessions.clear()
+    sessions.ip_index.clear()
+
+
+def new_request(app, ip='10.0.0.1'):
+    """Create a request context with a fresh (cookie-less) Flask session."""
+    return app.test_request_context('/', environ_base={'REMOTE_ADDR': ip})
+
+
+class TestGetSessionData:
+    """Tests for get_session_data function."""
+
+    def test_creates_session(self, app):
+        """A new visitor should get empty session data."""
+        with new_request(app):
+            data = get_session_data()
+        assert data['items'] == []
+        assert data['category'] is None
+        assert len(sessions.sessions) == 1
+
+    def test_returns_same_data_for_same_session(self, app):
+        """Repeated calls in one session should return the same data dict."""
+        with new_request(app):
+            first = get_session_data()
+            second = get_session_data()
+        assert first is second
+
+    def test_sessions_have_independent_details_locks(self, app):
+        """Each session should get its own details lock."""
+        with new_request(app):
+            first = get_session_data()
+        with new_request(app):
+            second = get_session_data()
+        assert first['details_lock'] is not second['details_lock']
+
+    def test_per_ip_limit_evicts_oldest(self, app):
+        """An IP over MAX_SESSIONS_PER_IP should lose its oldest session."""
+        for _ in range(sessions.MAX_SESSIONS_PER_IP + 1):
+            with new_request(app):
+                get_session_data()
+        assert len(sessions.sessions) == sessions.MAX_SESSIONS_PER_IP
+        assert len(sessions.ip_index['10.0.0.1']) == sessions.MAX_SESSIONS_PER_IP
+
+    def test_total_limit_enforced_on_create(self, app, monkeypatch):
+        """New sessions beyond MAX_TOTAL_SESSIONS should evict the oldest right away."""
+        monkeypatch.setattr(sessions, 'MAX_TOTAL_SESSIONS', 2)
+        for i in range(3):
+            with new_request(app, ip=f'10.0.2.{i}'):
+                get_session_data()
+        assert len(sessions.sessions) == 2
+        assert '10.0.2.0' not in sessions.ip_index
+
+    def test_per_ip_limit_is_per_ip(self, app):
+        """Sessions from other IPs should not count towards the limit."""
+        for i in range(sessions.MAX_SESSIONS_PER_IP + 1):
+            with new_request(app, ip=f'10.0.0.{i}'):
+                get_session_data()
+        assert len(sessions.sessions) == sessions.MAX_SESSIONS_PER_IP + 1
+
+
+class TestCleanupSessions:
+    """Tests for cleanup_sessions function."""
+
+    def test_removes_expired_sessions(self, app, monkeypatch):
+        """Sessions idle longer than SESSION_EXPIRY_SECONDS should be removed."""
+        with new_request(app):
+            get_session_data()
+        with new_request(app, ip='10.0.0.2'):
+            get_session_data()
+
+        later = sessions.time.time() + sessions.SESSION_EXPIRY_SECONDS + 1
+        monkeypatch.setattr(sessions.time, 'time', lambda: later)
+        cleanup_sessions()
+
+        assert len(sessions.sessions) == 0
+        assert sessions.ip_index == {}
+
+    def test_enforces_total_limit(self, app, monkeypatch):
+        """Cleanup should trim down to MAX_TOTAL_SESSIONS, oldest first."""
+        ids = []
+        for i in range(3):
+            with new_request(app, ip=f'10.0.1.{i}'):
+                get_session_data()
+            ids.append(next(reversed(sessions.sessions)))
+        # Lower the cap afterwards so the store is over it when cleanup runs;
+        # get_session_data would otherwise have evicted on create
+        monkeypatch.setattr(sessions, 'MAX_TOTAL_SESSIONS', 2)
+        assert len(sessions.sessions) == 3
+
+        cleanup_sessions()
+
+        assert list(sessions.sessions) == ids[1:]
+        assert '10.0.1.0' not in sessions.ip_index
+
+    def test_background_thread_runs_cleanup(self, app, monkeypatch):
+        """The sweeper thread should remove expired sessions on its own."""
+        monkeypatch.setattr(sessions, 'SESSION_EXPIRY_SECONDS', 0)
+        with new_request(app):
+            get_session_data()
+
+        stop = start_cleanup_thread(interval=0.01)
+        try:
+            deadline = time.time() + 2
+            while sessions.sessions and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            stop.set()
+
+        assert len(sessions.sessions) == 0